@@ -1,10 +1,25 @@
+import hashlib
+import threading
+import time
 from fastapi import Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import Optional
+from cachetools import TTLCache
 from auth import decode_access_token
 from database import get_db
 from models import SysUser, SysStudent, UserRole
 
+# Process-local caches keyed by token hash: verified (exp, user_id) pairs and rejected tokens.
+# They only save the JWT decode; the user row is still queried on every request.
+_user_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+_invalid_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=5)
+_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> str:
+    """Build a cache key for a token without keeping the raw token in memory"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
 
 def get_current_user(
     authorization: Optional[str] = Header(None),
@@ -18,9 +33,50 @@ def get_current_user(
         )
     
     token = authorization.replace("Bearer ", "")
+    key = _token_key(token)
+    
+    with _cache_lock:
+        cached = _user_cache.get(key)
+        is_invalid = key in _invalid_token_cache
+    
+    if is_invalid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token"
+        )
+    
+    user_id = None
+    if cached:
+        expires_at, cached_user_id = cached
+        if expires_at is None or expires_at > time.time():
+            # Token already verified; skip decoding it again
+            user_id = cached_user_id
+        else:
+            with _cache_lock:
+                _user_cache.pop(key, None)
+    
+    if user_id is None:
+        user_id = _verify_token(token, key)
+    
+    # Load the user into this request's session so it sees current data. get_db
+    # opens a fresh Session per request, so this always runs the SELECT (+ student join)
+    user = db.get(SysUser, user_id, options=[joinedload(SysUser.student)])
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    
+    return user
+
+
+def _verify_token(token: str, key: str) -> int:
+    """Decode a JWT, cache the outcome and return the user id it was issued for"""
     payload = decode_access_token(token)
     
     if not payload:
+        with _cache_lock:
+            _invalid_token_cache[key] = True
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
@@ -33,14 +89,11 @@ def get_current_user(
             detail="Invalid token payload"
         )
     
-    user = db.query(SysUser).filter(SysUser.id == int(user_id)).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
+    user_id = int(user_id)
+    with _cache_lock:
+        _user_cache[key] = (payload.get("exp"), user_id)
     
-    return user
+    return user_id
 
 
 def require_student(current_user: SysUser = Depends(get_current_user)) -> SysStudent:
@@ -17,8 +17,7 @@ def seed_database():
         print("Starting database seeding...")
         
         # Check if data already exists
-        existing_users = db.query(SysUser).count()
-        if existing_users > 0:
+        if db.query(SysUser.id).first() is not None:
             print("Database already contains data. Skipping seed.")
             return
         
@@ -29,7 +28,6 @@ def seed_database():
             role=UserRole.ADMIN,
             avatar_url=None
         )
-        db.add(admin_user)
         
         # Create teachers
         teachers = [
@@ -37,47 +35,36 @@ def seed_database():
             SysTeacher(name="王讲师", title="讲师", department="软件学院"),
             SysTeacher(name="张副教授", title="副教授", department="人工智能学院"),
         ]
-        for teacher in teachers:
-            db.add(teacher)
         
-        # Create student users
+        # Create student users with their profiles; the relationship lets the
+        # unit of work fill in user_id, so everything is inserted in one flush
         student_user1 = SysUser(
             username="student001",
             password_hash=get_password_hash("password123"),
             role=UserRole.STUDENT,
-            avatar_url=None
-        )
-        db.add(student_user1)
-        db.flush()  # Get user ID
-        
-        # Create student profile
-        student1 = SysStudent(
-            user_id=student_user1.id,
-            student_number="2021001",
-            name="张三",
-            major="计算机科学与技术",
-            persona_cache=None
+            avatar_url=None,
+            student=SysStudent(
+                student_number="2021001",
+                name="张三",
+                major="计算机科学与技术",
+                persona_cache=None
+            )
         )
-        db.add(student1)
         
-        # Create another student
         student_user2 = SysUser(
             username="student002",
             password_hash=get_password_hash("password123"),
             role=UserRole.STUDENT,
-            avatar_url=None
+            avatar_url=None,
+            student=SysStudent(
+                student_number="2021002",
+                name="李四",
+                major="软件工程",
+                persona_cache=None
+            )
         )
-        db.add(student_user2)
-        db.flush()
         
-        student2 = SysStudent(
-            user_id=student_user2.id,
-            student_number="2021002",
-            name="李四",
-            major="软件工程",
-            persona_cache=None
-        )
-        db.add(student2)
+        db.add_all([admin_user, *teachers, student_user1, student_user2])
         
         db.commit()
         print("Database seeded successfully!")
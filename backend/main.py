@@ -5,9 +5,11 @@ FastAPI Application Entry Point
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from config import settings
 from database import init_db
+import asyncio
 import os
 
 # Import routers
@@ -17,7 +19,16 @@ from routers import auth, common, student, admin, certificate
 app = FastAPI(
     title="Student Information Service Platform API",
     description="Backend API for student achievement management and AI analysis",
-    version="3.0.0"
+    version="3.0.0",
+    default_response_class=ORJSONResponse
+)
+
+# Reject oversize uploads from Content-Length before the body is received
+# (registered before CORS so CORS wraps it and the 413 carries CORS headers)
+from middleware.upload_limit import UploadSizeLimitMiddleware
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_files_by_path={"/api/certificate/batch-recognize": certificate.MAX_BATCH_SIZE}
 )
 
 # Configure CORS
@@ -49,10 +60,23 @@ app.include_router(certificate.router)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Initialize database and start background jobs on startup"""
     print("Initializing database...")
     init_db()
     print("Database initialized successfully!")
+    
+    # Periodically remove stale temporary certificate files
+    from services.file_manager import file_manager
+    app.state.cleanup_task = asyncio.create_task(file_manager.run_periodic_cleanup())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs and release shared HTTP connections on shutdown"""
+    app.state.cleanup_task.cancel()
+    
+    from services.certificate_recognition import certificate_recognition_service
+    await certificate_recognition_service.aclose()
 
 
 @app.get("/")
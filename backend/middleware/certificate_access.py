@@ -13,6 +13,7 @@ from config import settings
 from auth import decode_token
 from database import SessionLocal
 from models import SysUser, UserRole
+from services.file_manager import file_manager
 
 
 class CertificateAccessMiddleware(BaseHTTPMiddleware):
@@ -98,6 +99,12 @@ class CertificateAccessMiddleware(BaseHTTPMiddleware):
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail=f"Authentication failed: {str(e)}"
                 )
+            
+            # Access granted - let the reverse proxy send the file (sendfile, zero-copy)
+            if settings.USE_X_ACCEL_REDIRECT:
+                return Response(headers={
+                    "X-Accel-Redirect": file_manager.build_accel_redirect(request.url.path)
+                })
         
         # Continue with request
         response = await call_next(request)
@@ -0,0 +1,40 @@
+"""
+Middleware for rejecting oversize uploads early
+Checks the declared Content-Length before any of the request body is read
+"""
+
+from typing import Dict, Optional
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from config import settings
+
+# Allowance for multipart boundaries and part headers on top of the file data
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimitMiddleware(BaseHTTPMiddleware):
+    """Middleware to reject requests whose body would exceed the upload limit"""
+    
+    def __init__(self, app, max_files_by_path: Optional[Dict[str, int]] = None):
+        super().__init__(app)
+        # Endpoints accepting several files get a proportionally larger limit
+        self.max_files_by_path = max_files_by_path or {}
+    
+    async def dispatch(self, request: Request, call_next):
+        content_length = request.headers.get("content-length")
+        
+        if content_length and content_length.isdigit():
+            max_files = self.max_files_by_path.get(request.url.path, 1)
+            max_body_size = settings.MAX_FILE_SIZE * max_files + MULTIPART_OVERHEAD
+            
+            if int(content_length) > max_body_size:
+                return JSONResponse(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    content={"detail": f"File size exceeds maximum of {settings.MAX_FILE_SIZE} bytes"}
+                )
+        
+        # Requests without Content-Length (chunked) are limited while streaming to disk
+        response = await call_next(request)
+        return response
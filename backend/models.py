@@ -1,10 +1,69 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, ForeignKey, JSON
+from sqlalchemy import Column, Integer, SmallInteger, String, Text, DateTime, Enum, ForeignKey, JSON, Index
+from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
-from datetime import datetime
 import enum
 from database import Base
 
 
+class utc_now(FunctionElement):
+    """
+    Current UTC time, evaluated by the database inside the INSERT/UPDATE
+    
+    Used as the ORM-side default so no timestamp is bound from Python and the
+    column is filled even on tables created before it had a server default.
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now)
+def _compile_utc_now(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utc_now, "mysql")
+def _compile_utc_now_mysql(element, compiler, **kw):
+    return "UTC_TIMESTAMP()"
+
+
+@compiles(utc_now, "postgresql")
+def _compile_utc_now_postgresql(element, compiler, **kw):
+    return "(NOW() AT TIME ZONE 'utc')"
+
+
+class SmallIntEnum(TypeDecorator):
+    """
+    Store a Python enum as a SMALLINT code instead of a native ENUM column
+    
+    Codes are given explicitly, so reordering or adding enum members never
+    changes the meaning of stored values.
+    """
+    impl = SmallInteger
+    cache_ok = True
+    
+    def __init__(self, enum_type, codes: dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if set(codes) != set(enum_type) or len(set(codes.values())) != len(codes):
+            raise ValueError(f"codes must map every {enum_type.__name__} member to a unique code")
+        self.enum_type = enum_type
+        self._to_code = dict(codes)
+        self._from_code = {code: member for member, code in codes.items()}
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self._to_code[self.enum_type(value)]
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._from_code[value]
+
+
 class UserRole(str, enum.Enum):
     """User role enumeration"""
     STUDENT = "student"
@@ -31,9 +90,14 @@ class SysUser(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
-    role = Column(Enum(UserRole), nullable=False)
+    # Stored codes are persistent; never renumber them (see README for migrating old rows)
+    role = Column(
+        SmallIntEnum(UserRole, {UserRole.STUDENT: 1, UserRole.ADMIN: 2}),
+        nullable=False,
+        index=True
+    )
     avatar_url = Column(String(500))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utc_now(), server_default=func.now())
     
     # Relationships
     student = relationship("SysStudent", back_populates="user", uselist=False)
@@ -80,9 +144,16 @@ class BizAchievement(Base):
     type = Column(String(50), nullable=False)  # 字典值
     content_json = Column(JSON)  # OCR识别后的结构化详情
     evidence_url = Column(String(500))  # 证书图片地址
-    status = Column(Enum(AchievementStatus), default=AchievementStatus.PENDING, index=True)
+    status = Column(Enum(AchievementStatus), default=AchievementStatus.PENDING)
     audit_comment = Column(Text)  # 审核意见
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=utc_now(), server_default=func.now(), index=True)
+    
+    # Composite indexes for the admin review list (status filter + newest first)
+    # and a student's own list filtered by status; both also cover status alone
+    __table_args__ = (
+        Index("ix_ach_status_created", "status", "created_at"),
+        Index("ix_ach_student_status", "student_id", "status"),
+    )
     
     # Relationships
     student = relationship("SysStudent", back_populates="achievements")
@@ -93,10 +164,10 @@ class AiChatSession(Base):
     """AI chat session table"""
     __tablename__ = "ai_chat_sessions"
     
-    id = Column(String(36), primary_key=True)  # UUID
+    id = Column(String(36), primary_key=True)  # UUIDv7, time-ordered for index locality
     student_id = Column(Integer, ForeignKey("sys_students.id"), nullable=False, index=True)
     title = Column(String(200))  # 会话摘要
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=utc_now(), server_default=func.now(), onupdate=utc_now())
     
     # Relationships
     student = relationship("SysStudent", back_populates="chat_sessions")
@@ -111,7 +182,7 @@ class AiChatMessage(Base):
     session_id = Column(String(36), ForeignKey("ai_chat_sessions.id"), nullable=False, index=True)
     role = Column(Enum(MessageRole), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=utc_now(), server_default=func.now(), index=True)
     
     # Relationships
     session = relationship("AiChatSession", back_populates="messages")
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, Query, Path
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_
 from typing import Optional
 from datetime import datetime
 from database import get_db
 from schemas import AchievementListResponse, AchievementResponse, AchievementAudit
-from utils import success_response, error_response
+from utils import success_response, error_response, success_response_bytes
 from models import (
     BizAchievement, AchievementStatus, SysStudent,
     SysTeacher, SysUser
@@ -71,10 +72,13 @@ async def get_achievements_for_review(
             "content_json": ach.content_json
         })
     
-    return success_response(data={
-        "list": achievement_list,
-        "total": total
-    })
+    return Response(
+        content=success_response_bytes(data={
+            "list": achievement_list,
+            "total": total
+        }),
+        media_type="application/json"
+    )
 
 
 @router.patch("/achievements/{achievement_id}/audit")
@@ -1,5 +1,6 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from database import get_db
 from schemas import LoginRequest, LoginResponse, UserInfo
 from utils import success_response, error_response
@@ -16,10 +17,19 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
     - Validates username and password
     - Returns JWT token and user info
     """
-    # Find user
-    user = db.query(SysUser).filter(SysUser.username == request.username).first()
+    # Find user (student profile is joined in for the display name)
+    user = (
+        db.query(SysUser)
+        .options(joinedload(SysUser.student))
+        .filter(SysUser.username == request.username)
+        .first()
+    )
     
-    if not user or not verify_password(request.password, user.password_hash):
+    # bcrypt is CPU-bound, so verify in a worker thread to keep the event loop free
+    is_valid = user is not None and await asyncio.to_thread(
+        verify_password, request.password, user.password_hash
+    )
+    if not is_valid:
         return error_response(msg="Invalid username or password", code=401)
     
     # Create access token
@@ -32,13 +42,15 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
     if user.role == UserRole.STUDENT and user.student:
         user_name = user.student.name
     
-    user_info = UserInfo(
+    # Values come straight from the database and the token we just signed,
+    # so build the models without re-validating them
+    user_info = UserInfo.model_construct(
         id=user.id,
         name=user_name,
         role=user.role
     )
     
-    response_data = LoginResponse(
+    response_data = LoginResponse.model_construct(
         token=access_token,
         userInfo=user_info
     )
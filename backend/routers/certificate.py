@@ -4,13 +4,16 @@ Provides API endpoints for certificate recognition using AI
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import List, Dict
+from typing import List, Dict, Optional
+from functools import lru_cache
 import os
 import uuid
+import aiofiles.os
 from datetime import datetime
 
 from config import settings
 from services.certificate_recognition import certificate_recognition_service
+from services.file_manager import write_upload_file
 from dependencies import get_current_user
 from models import SysUser
 
@@ -19,6 +22,19 @@ router = APIRouter(
     tags=["Certificate Recognition"]
 )
 
+# Image types accepted for recognition
+ALLOWED_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".gif"})
+
+# Maximum number of files accepted by the batch endpoint
+MAX_BATCH_SIZE = 10
+
+# Temporary storage for images while they are being recognized
+TEMP_CERTIFICATES_DIR = os.path.join(settings.UPLOAD_DIR, "temp_certificates")
+os.makedirs(TEMP_CERTIFICATES_DIR, exist_ok=True)
+
+# Maximum number of concurrent recognition API calls per batch request
+MAX_RECOGNITION_CONCURRENCY = 5
+
 
 @router.post("/recognize", response_model=Dict)
 async def recognize_certificate(
@@ -49,34 +65,21 @@ async def recognize_certificate(
         - confidence: Confidence level of recognition
     """
     # Validate file type
-    allowed_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".gif"]
     file_extension = os.path.splitext(file.filename)[1].lower()
     
-    if file_extension not in allowed_extensions:
+    if file_extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid file type. Allowed types: {', '.join(allowed_extensions)}"
-        )
-    
-    # Check file size
-    file_content = await file.read()
-    if len(file_content) > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE} bytes"
+            detail=f"Invalid file type. Allowed types: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
         )
     
     # Save file temporarily
-    temp_dir = os.path.join(settings.UPLOAD_DIR, "temp_certificates")
-    os.makedirs(temp_dir, exist_ok=True)
-    
     temp_filename = f"{uuid.uuid4()}{file_extension}"
-    temp_filepath = os.path.join(temp_dir, temp_filename)
+    temp_filepath = os.path.join(TEMP_CERTIFICATES_DIR, temp_filename)
     
     try:
-        # Write file to disk
-        with open(temp_filepath, "wb") as f:
-            f.write(file_content)
+        # Stream file to disk (size is checked while writing)
+        await write_upload_file(file, temp_filepath)
         
         # Recognize certificate
         result = await certificate_recognition_service.recognize_certificate(temp_filepath)
@@ -86,16 +89,17 @@ async def recognize_certificate(
         
         return validated_result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing certificate: {str(e)}")
     
     finally:
         # Clean up temporary file
-        if os.path.exists(temp_filepath):
-            try:
-                os.remove(temp_filepath)
-            except:
-                pass
+        try:
+            await aiofiles.os.remove(temp_filepath)
+        except OSError:
+            pass
 
 
 @router.post("/batch-recognize", response_model=Dict)
@@ -119,16 +123,12 @@ async def batch_recognize_certificates(
     - failed: Number of failed recognitions
     """
     # Validate number of files
-    max_batch_size = 10
-    if len(files) > max_batch_size:
+    if len(files) > MAX_BATCH_SIZE:
         raise HTTPException(
             status_code=400,
-            detail=f"Batch size exceeds maximum of {max_batch_size} files"
+            detail=f"Batch size exceeds maximum of {MAX_BATCH_SIZE} files"
         )
     
-    temp_dir = os.path.join(settings.UPLOAD_DIR, "temp_certificates")
-    os.makedirs(temp_dir, exist_ok=True)
-    
     temp_files = []
     results = []
     
@@ -136,10 +136,9 @@ async def batch_recognize_certificates(
         # Save all files temporarily
         for file in files:
             # Validate file type
-            allowed_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".gif"]
             file_extension = os.path.splitext(file.filename)[1].lower()
             
-            if file_extension not in allowed_extensions:
+            if file_extension not in ALLOWED_EXTENSIONS:
                 results.append({
                     "filename": file.filename,
                     "success": False,
@@ -147,9 +146,13 @@ async def batch_recognize_certificates(
                 })
                 continue
             
-            # Check file size
-            file_content = await file.read()
-            if len(file_content) > settings.MAX_FILE_SIZE:
+            # Save file, rejecting it as soon as it exceeds the size limit
+            temp_filename = f"{uuid.uuid4()}{file_extension}"
+            temp_filepath = os.path.join(TEMP_CERTIFICATES_DIR, temp_filename)
+            
+            try:
+                await write_upload_file(file, temp_filepath)
+            except HTTPException:
                 results.append({
                     "filename": file.filename,
                     "success": False,
@@ -157,24 +160,19 @@ async def batch_recognize_certificates(
                 })
                 continue
             
-            # Save file
-            temp_filename = f"{uuid.uuid4()}{file_extension}"
-            temp_filepath = os.path.join(temp_dir, temp_filename)
-            
-            with open(temp_filepath, "wb") as f:
-                f.write(file_content)
-            
             temp_files.append({
                 "filepath": temp_filepath,
                 "original_filename": file.filename
             })
         
-        # Recognize all certificates
-        for temp_file in temp_files:
+        # Recognize all certificates concurrently (bounded to avoid API rate limits)
+        raw_results = await certificate_recognition_service.batch_recognize_certificates(
+            [temp_file["filepath"] for temp_file in temp_files],
+            max_concurrency=MAX_RECOGNITION_CONCURRENCY
+        )
+        
+        for temp_file, result in zip(temp_files, raw_results):
             try:
-                result = await certificate_recognition_service.recognize_certificate(
-                    temp_file["filepath"]
-                )
                 validated_result = certificate_recognition_service.validate_recognition_result(result)
                 
                 results.append({
@@ -206,11 +204,10 @@ async def batch_recognize_certificates(
     finally:
         # Clean up all temporary files
         for temp_file in temp_files:
-            if os.path.exists(temp_file["filepath"]):
-                try:
-                    os.remove(temp_file["filepath"])
-                except:
-                    pass
+            try:
+                await aiofiles.os.remove(temp_file["filepath"])
+            except OSError:
+                pass
 
 
 @router.get("/health")
@@ -223,11 +220,15 @@ async def certificate_recognition_health():
     - configured: Whether API key is configured
     - model: Model name being used
     """
-    is_configured = bool(settings.QWEN_API_KEY and settings.QWEN_API_KEY != "")
-    
+    return _health_payload(bool(settings.QWEN_API_KEY), settings.QWEN_MODEL_NAME)
+
+
+@lru_cache(maxsize=2)
+def _health_payload(is_configured: bool, model_name: Optional[str]) -> Dict:
+    """Build the health response once per configuration (it is never mutated)"""
     return {
         "status": "ready" if is_configured else "not_configured",
         "configured": is_configured,
-        "model": settings.QWEN_MODEL_NAME if is_configured else None,
+        "model": model_name if is_configured else None,
         "message": "Certificate recognition service is ready" if is_configured else "API key not configured"
     }
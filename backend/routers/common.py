@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from typing import List
 import os
 import uuid
 import aiofiles
 from database import get_db
-from schemas import TeacherResponse, UploadResponse
-from utils import success_response, error_response
+from schemas import UploadResponse
+from utils import success_response, error_response, success_response_bytes
 from models import SysTeacher
 from dependencies import get_current_user
 from config import settings
@@ -14,7 +14,7 @@ from config import settings
 router = APIRouter(prefix="/api/v1/common", tags=["Common"])
 
 
-@router.get("/teachers", response_model=List[TeacherResponse])
+@router.get("/teachers")
 async def get_teachers(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -34,7 +34,7 @@ async def get_teachers(
         for t in teachers
     ]
     
-    return success_response(data=teacher_list)
+    return Response(content=success_response_bytes(data=teacher_list), media_type="application/json")
 
 
 @router.post("/upload")
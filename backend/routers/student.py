@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import Optional, List
-import uuid
 import httpx
 from datetime import datetime, timedelta
 from database import get_db
@@ -9,10 +9,10 @@ from schemas import (
     OCRResponse, AchievementCreate, AchievementResponse,
     ChatRequest, ChatResponse, PersonaResponse
 )
-from utils import success_response, error_response
+from utils import success_response, error_response, success_response_bytes, uuid7
 from models import (
     SysStudent, BizAchievement, AchievementStatus,
-    AiChatSession, AiChatMessage, MessageRole, SysTeacher
+    AiChatSession, AiChatMessage, MessageRole, SysTeacher, utc_now
 )
 from dependencies import require_student
 from config import settings
@@ -175,7 +175,7 @@ async def get_my_achievements(
             "teacher_name": ach.teacher.name if ach.teacher else None
         })
     
-    return success_response(data=achievement_list)
+    return Response(content=success_response_bytes(data=achievement_list), media_type="application/json")
 
 
 @router.get("/certificates")
@@ -254,7 +254,7 @@ async def ai_chat(
     
     if not session_id:
         # Create new session
-        session_id = str(uuid.uuid4())
+        session_id = str(uuid7())
         new_session = AiChatSession(
             id=session_id,
             student_id=student.id,
@@ -332,7 +332,7 @@ async def ai_chat(
     
     # Update session timestamp
     session = db.query(AiChatSession).filter(AiChatSession.id == session_id).first()
-    session.updated_at = datetime.utcnow()
+    session.updated_at = utc_now()
     
     db.commit()
     
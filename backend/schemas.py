@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Any, Dict, List
 from datetime import datetime
 from models import UserRole, AchievementStatus, MessageRole
@@ -23,8 +23,7 @@ class UserInfo(BaseModel):
     name: str
     role: UserRole
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class LoginResponse(BaseModel):
@@ -44,8 +43,7 @@ class TeacherResponse(BaseModel):
     name: str
     department: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ============= Achievement Models =============
@@ -70,8 +68,7 @@ class AchievementResponse(BaseModel):
     teacher_name: Optional[str] = None
     create_time: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AchievementListResponse(BaseModel):
@@ -147,3 +144,14 @@ class ChatResponse(BaseModel):
 class PersonaResponse(BaseModel):
     persona_data: Optional[Dict] = None
     last_updated: Optional[datetime] = None
+
+
+# Resolve nested model schemas at import time rather than on first request
+for _model in (
+    UserInfo,
+    LoginResponse,
+    AchievementResponse,
+    AchievementListResponse,
+    CertificateRecognitionResponse,
+):
+    _model.model_rebuild()
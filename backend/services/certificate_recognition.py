@@ -3,144 +3,289 @@ Certificate Recognition Service
 Uses Alibaba Cloud Bailian (Qwen-plus) to recognize and extract information from achievement certificates
 """
 
+import asyncio
 import base64
-import json
-from typing import Dict, Optional
+import hashlib
+import re
+from typing import Any, Dict, Optional
 from datetime import datetime
+from pathlib import Path
 import httpx
+import msgspec
+import orjson
+from cachetools import TTLCache
 from config import settings
 
+# Client errors that mean the request itself was refused, not that the image URL
+# was unusable; these are never retried with the image inline
+_NO_INLINE_FALLBACK_STATUSES = frozenset({401, 403, 429})
+
+# Recognition results are cached by image content for this long
+RESULT_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+
+# Only the fields read from the Qwen response envelope; everything else is skipped
+class QwenMessage(msgspec.Struct):
+    content: str
+
+
+class QwenChoice(msgspec.Struct):
+    message: QwenMessage
+
+
+class QwenOutput(msgspec.Struct):
+    choices: list[QwenChoice]
+
+
+class QwenResponse(msgspec.Struct):
+    output: QwenOutput
+
+
+_qwen_response_decoder = msgspec.json.Decoder(QwenResponse)
+
+
+# Fields that must be present for a recognition to count as successful
+REQUIRED_CERTIFICATE_FIELDS = ("certificate_name", "recipient_name", "issuing_organization")
+
+
+class CertificateData(msgspec.Struct, kw_only=True):
+    """Normalized certificate information returned by recognition"""
+    certificate_name: Optional[str] = None
+    recipient_name: Optional[str] = None
+    issuing_organization: Optional[str] = None
+    # Only the required fields are typed; the model returns the rest in varying forms
+    issue_date: Any = None
+    certificate_number: Any = None
+    award_level: Any = None
+    category: Any = None
+    additional_info: Any = None
+    recognition_time: Any = None
+    model_used: Any = None
+    confidence: Any = None
+    
+    def __post_init__(self):
+        for field in REQUIRED_CERTIFICATE_FIELDS:
+            value = getattr(self, field)
+            if value:
+                setattr(self, field, value.strip())
+
+
+# Prompt for certificate recognition, sent after the image in every request
+CERTIFICATE_PROMPT = """请识别这张获奖证书/成果证书，并提取以下信息：
+1. 证书名称/奖项名称
+2. 获得者姓名
+3. 颁发单位/组织
+4. 获奖时间/颁发日期
+5. 证书编号（如果有）
+6. 奖项等级（如：一等奖、二等奖、三等奖等）
+7. 获奖类别（如：学术竞赛、科技创新、文体活动等）
+8. 其他重要信息
+
+请以JSON格式返回结果，格式如下：
+{
+    "certificate_name": "证书/奖项名称",
+    "recipient_name": "获得者姓名",
+    "issuing_organization": "颁发单位",
+    "issue_date": "YYYY-MM-DD",
+    "certificate_number": "证书编号（如果有）",
+    "award_level": "奖项等级",
+    "category": "获奖类别",
+    "additional_info": "其他重要信息"
+}
+
+如果某个字段无法识别，请使用null。"""
+_PROMPT_PART = {"text": CERTIFICATE_PROMPT}
+
+# JSON body of a markdown code fence (``` or ```json) in the model reply
+_CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
 
 class CertificateRecognitionService:
     """Service for recognizing and extracting information from certificates using AI"""
     
     def __init__(self):
-        self.api_key = settings.QWEN_API_KEY
         self.model_name = settings.QWEN_MODEL_NAME
         self.api_url = settings.QWEN_API_URL
+        # SHA-256 of image bytes -> (certificate_data, raw model output)
+        self._result_cache: TTLCache = TTLCache(maxsize=1024, ttl=RESULT_CACHE_TTL_SECONDS)
+        # Shared HTTP client, created on first use so connections are reused
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def api_key(self) -> str:
+        """Qwen API key, resolved from settings on first use"""
+        return settings.QWEN_API_KEY
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared keep-alive HTTP/2 client for the Qwen API"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                timeout=60.0,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the shared HTTP client (called on application shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def encode_image_to_base64(self, image_bytes: bytes) -> str:
+        """
+        Encode image content to base64 string
         
-    def encode_image_to_base64(self, image_path: str) -> str:
+        Args:
+            image_bytes: Raw image file content
+            
+        Returns:
+            Base64 encoded string of the image
+        """
+        return base64.b64encode(image_bytes).decode('ascii')
+    
+    def _build_payload(self, image: str) -> bytes:
+        """
+        Serialize the recognition request body
+        
+        Args:
+            image: Image URL or base64 data URI
+            
+        Returns:
+            JSON-encoded payload
+        """
+        return orjson.dumps({
+            "model": self.model_name,
+            "input": {
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [{"image": image}, _PROMPT_PART]
+                    }
+                ]
+            }
+        })
+    
+    def _to_data_uri(self, image_bytes: bytes) -> str:
+        """Embed image content as a base64 data URI"""
+        return f"data:image/jpeg;base64,{self.encode_image_to_base64(image_bytes)}"
+    
+    def get_public_image_url(self, image_path: str) -> Optional[str]:
         """
-        Encode image file to base64 string
+        Get the public URL of an image stored under the upload directory
         
         Args:
             image_path: Path to the image file
             
         Returns:
-            Base64 encoded string of the image
+            URL the API can fetch the image from, or None when URL mode is
+            disabled or the file is outside the upload directory
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        if not settings.QWEN_USE_URL_UPLOAD or not settings.QWEN_IMAGE_BASE_URL:
+            return None
+        
+        try:
+            relative_path = Path(image_path).resolve().relative_to(
+                Path(settings.UPLOAD_DIR).resolve()
+            )
+        except ValueError:
+            return None
+        
+        return f"{settings.QWEN_IMAGE_BASE_URL.rstrip('/')}/{relative_path.as_posix()}"
     
-    async def recognize_certificate(self, image_path: str) -> Dict:
+    async def recognize_certificate(self, image_path: str, bypass_cache: bool = False) -> Dict:
         """
         Recognize certificate and extract structured information
         
+        Identical images are answered from an in-process cache keyed by the
+        SHA-256 of their content, so re-uploads do not call the API again.
+        
         Args:
             image_path: Path to the certificate image
+            bypass_cache: Skip the cache lookup and force a fresh recognition
             
         Returns:
             Dictionary containing extracted certificate information
         """
         try:
-            # Encode image to base64
-            image_base64 = self.encode_image_to_base64(image_path)
+            # Read image once (off the event loop); the bytes are used for the
+            # cache key and the payload
+            image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
             
-            # Prepare the prompt for certificate recognition
-            prompt = """请识别这张获奖证书/成果证书，并提取以下信息：
-1. 证书名称/奖项名称
-2. 获得者姓名
-3. 颁发单位/组织
-4. 获奖时间/颁发日期
-5. 证书编号（如果有）
-6. 奖项等级（如：一等奖、二等奖、三等奖等）
-7. 获奖类别（如：学术竞赛、科技创新、文体活动等）
-8. 其他重要信息
-
-请以JSON格式返回结果，格式如下：
-{
-    "certificate_name": "证书/奖项名称",
-    "recipient_name": "获得者姓名",
-    "issuing_organization": "颁发单位",
-    "issue_date": "YYYY-MM-DD",
-    "certificate_number": "证书编号（如果有）",
-    "award_level": "奖项等级",
-    "category": "获奖类别",
-    "additional_info": "其他重要信息"
-}
-
-如果某个字段无法识别，请使用null。"""
-            
-            # Call Qwen API
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            cache_key = hashlib.sha256(image_bytes).hexdigest()
+            if not bypass_cache:
+                cached = self._result_cache.get(cache_key)
+                if cached:
+                    certificate_data, raw_content = cached
+                    return {
+                        "success": True,
+                        "data": dict(certificate_data),
+                        "raw_response": raw_content
+                    }
             
-            payload = {
-                "model": self.model_name,
-                "input": {
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "image": f"data:image/jpeg;base64,{image_base64}"
-                                },
-                                {
-                                    "text": prompt
-                                }
-                            ]
-                        }
-                    ]
-                }
-            }
+            # Send a public URL when one is available (no base64 inflation of the
+            # request body), otherwise embed the image inline
+            image_url = self.get_public_image_url(image_path)
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            # Call Qwen API
+            client = self._get_client()
+            response = await client.post(
+                self.api_url,
+                content=self._build_payload(image_url or self._to_data_uri(image_bytes))
+            )
+            if (
+                image_url
+                and response.is_client_error
+                and response.status_code not in _NO_INLINE_FALLBACK_STATUSES
+            ):
+                # The API could not fetch the URL; retry once with the image inline
                 response = await client.post(
                     self.api_url,
-                    headers=headers,
-                    json=payload
+                    content=self._build_payload(self._to_data_uri(image_bytes))
                 )
-                response.raise_for_status()
+            response.raise_for_status()
+            
+            try:
+                result = _qwen_response_decoder.decode(response.content)
+            except msgspec.ValidationError:
+                result = None
+            
+            # Extract the response text
+            if result and result.output.choices:
+                content = result.output.choices[0].message.content
                 
-                result = response.json()
+                # Try to parse JSON from the response
+                # The model might return JSON wrapped in markdown code blocks
+                fence_match = _CODE_FENCE_RE.search(content)
+                if fence_match:
+                    content = fence_match.group(1)
                 
-                # Extract the response text
-                if "output" in result and "choices" in result["output"]:
-                    content = result["output"]["choices"][0]["message"]["content"]
-                    
-                    # Try to parse JSON from the response
-                    # The model might return JSON wrapped in markdown code blocks
-                    if "```json" in content:
-                        json_start = content.find("```json") + 7
-                        json_end = content.find("```", json_start)
-                        content = content[json_start:json_end].strip()
-                    elif "```" in content:
-                        json_start = content.find("```") + 3
-                        json_end = content.find("```", json_start)
-                        content = content[json_start:json_end].strip()
-                    
-                    certificate_data = json.loads(content)
-                    
-                    # Add metadata
-                    certificate_data["recognition_time"] = datetime.utcnow().isoformat()
-                    certificate_data["model_used"] = self.model_name
-                    certificate_data["confidence"] = "high"  # Can be enhanced with actual confidence scores
-                    
-                    return {
-                        "success": True,
-                        "data": certificate_data,
-                        "raw_response": content
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": "Unexpected response format from API",
-                        "raw_response": result
-                    }
-                    
-        except json.JSONDecodeError as e:
+                certificate_data = orjson.loads(content)
+                
+                # Add metadata
+                certificate_data["recognition_time"] = datetime.utcnow().isoformat()
+                certificate_data["model_used"] = self.model_name
+                certificate_data["confidence"] = "high"  # Can be enhanced with actual confidence scores
+                
+                self._result_cache[cache_key] = (dict(certificate_data), content)
+                
+                return {
+                    "success": True,
+                    "data": certificate_data,
+                    "raw_response": content
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": "Unexpected response format from API",
+                    "raw_response": response.text
+                }
+                
+        except (orjson.JSONDecodeError, msgspec.DecodeError) as e:
             return {
                 "success": False,
                 "error": f"Failed to parse JSON response: {str(e)}",
@@ -157,21 +302,37 @@ class CertificateRecognitionService:
                 "error": f"Unexpected error: {str(e)}"
             }
     
-    async def batch_recognize_certificates(self, image_paths: list[str]) -> list[Dict]:
+    async def batch_recognize_certificates(
+        self,
+        image_paths: list[str],
+        max_concurrency: int = 8
+    ) -> list[Dict]:
         """
-        Batch recognize multiple certificates
+        Batch recognize multiple certificates concurrently
         
         Args:
             image_paths: List of paths to certificate images
+            max_concurrency: Maximum number of API calls in flight at once
             
         Returns:
-            List of dictionaries containing extracted information for each certificate
+            List of dictionaries containing extracted information for each certificate,
+            in the same order as image_paths
         """
-        results = []
-        for image_path in image_paths:
-            result = await self.recognize_certificate(image_path)
-            results.append(result)
-        return results
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def recognize_one(image_path: str) -> Dict:
+            async with semaphore:
+                return await self.recognize_certificate(image_path)
+        
+        results = await asyncio.gather(
+            *(recognize_one(image_path) for image_path in image_paths),
+            return_exceptions=True
+        )
+        return [
+            {"success": False, "error": f"Unexpected error: {str(result)}"}
+            if isinstance(result, Exception) else result
+            for result in results
+        ]
     
     def validate_recognition_result(self, result: Dict) -> Dict:
         """
@@ -188,9 +349,21 @@ class CertificateRecognitionService:
         
         data = result.get("data", {})
         
+        # Convert to the certificate schema (unknown keys are dropped)
+        try:
+            certificate = msgspec.convert(data, CertificateData)
+        except msgspec.ValidationError as e:
+            return {
+                "success": False,
+                "error": f"Invalid certificate data: {str(e)}",
+                "data": data
+            }
+        
         # Validate required fields
-        required_fields = ["certificate_name", "recipient_name", "issuing_organization"]
-        missing_fields = [field for field in required_fields if not data.get(field)]
+        missing_fields = [
+            field for field in REQUIRED_CERTIFICATE_FIELDS
+            if not getattr(certificate, field)
+        ]
         
         if missing_fields:
             return {
@@ -199,24 +372,9 @@ class CertificateRecognitionService:
                 "data": data
             }
         
-        # Clean and normalize data
-        cleaned_data = {
-            "certificate_name": data.get("certificate_name", "").strip(),
-            "recipient_name": data.get("recipient_name", "").strip(),
-            "issuing_organization": data.get("issuing_organization", "").strip(),
-            "issue_date": data.get("issue_date"),
-            "certificate_number": data.get("certificate_number"),
-            "award_level": data.get("award_level"),
-            "category": data.get("category"),
-            "additional_info": data.get("additional_info"),
-            "recognition_time": data.get("recognition_time"),
-            "model_used": data.get("model_used"),
-            "confidence": data.get("confidence")
-        }
-        
         return {
             "success": True,
-            "data": cleaned_data
+            "data": msgspec.to_builtins(certificate)
         }
 
 
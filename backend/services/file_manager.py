@@ -3,14 +3,62 @@ File Management Service
 Handles permanent storage and access control for certificate files
 """
 
+import asyncio
+import itertools
 import os
-import uuid
-from datetime import datetime
+import stat
+import time
+from functools import lru_cache
+import aiofiles
+import aiofiles.os
 from pathlib import Path
 from typing import Optional
 from fastapi import UploadFile, HTTPException
 from config import settings
 
+# File types accepted for permanent certificate storage
+ALLOWED_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".gif", ".pdf"})
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def write_upload_file(file: UploadFile, destination) -> int:
+    """
+    Stream an uploaded file to disk in chunks, enforcing the maximum file size
+    
+    The partial file is removed if the upload turns out to be too large.
+    
+    Args:
+        file: Uploaded file
+        destination: Path to write the file to
+        
+    Returns:
+        Number of bytes written
+    """
+    size = 0
+    async with aiofiles.open(destination, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.MAX_FILE_SIZE:
+                break
+            await f.write(chunk)
+    
+    if size > settings.MAX_FILE_SIZE:
+        await aiofiles.os.remove(destination)
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds maximum of {settings.MAX_FILE_SIZE} bytes"
+        )
+    
+    return size
+
+
+@lru_cache(maxsize=4096)
+def _student_certificate_prefix(student_id: int) -> str:
+    """Relative path prefix of a student's certificate directory"""
+    return f"certificates/student_{student_id}/"
+
 
 class FileManager:
     """Service for managing certificate file storage"""
@@ -23,23 +71,32 @@ class FileManager:
         # Create directories if they don't exist
         self.certificates_dir.mkdir(parents=True, exist_ok=True)
         self.temp_certificates_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Resolved once; used to keep path lookups inside the upload directory
+        self._upload_root = os.path.realpath(self.upload_dir) + os.sep
+        
+        # Student IDs whose certificate directory is known to exist
+        self._ensured_dirs: set[int] = set()
+        
+        # Disambiguates filenames generated within the same nanosecond tick
+        self._filename_counter = itertools.count()
     
     def _get_student_certificate_dir(self, student_id: int) -> Path:
         """Get the certificate directory for a specific student"""
         student_dir = self.certificates_dir / f"student_{student_id}"
-        student_dir.mkdir(parents=True, exist_ok=True)
+        if student_id not in self._ensured_dirs:
+            student_dir.mkdir(parents=True, exist_ok=True)
+            self._ensured_dirs.add(student_id)
         return student_dir
     
     def _generate_certificate_filename(self, student_id: int, original_filename: str) -> str:
         """
         Generate a unique filename for certificate
-        Format: cert_{student_id}_{timestamp}_{random}.{ext}
+        Format: cert_{student_id}_{timestamp_ns:x}_{counter:x}.{ext}
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        random_suffix = str(uuid.uuid4())[:8]
-        file_extension = Path(original_filename).suffix.lower()
+        file_extension = os.path.splitext(original_filename)[1].lower()
         
-        return f"cert_{student_id}_{timestamp}_{random_suffix}{file_extension}"
+        return f"cert_{student_id}_{time.time_ns():x}_{next(self._filename_counter):x}{file_extension}"
     
     async def save_certificate_permanent(
         self, 
@@ -57,23 +114,12 @@ class FileManager:
             Dictionary containing file path and URL
         """
         # Validate file extension
-        allowed_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".gif", ".pdf"]
         file_extension = Path(file.filename).suffix.lower()
         
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
-            )
-        
-        # Read file content
-        file_content = await file.read()
-        
-        # Validate file size
-        if len(file_content) > settings.MAX_FILE_SIZE:
+        if file_extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"File size exceeds maximum of {settings.MAX_FILE_SIZE} bytes"
+                detail=f"Invalid file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
             )
         
         # Generate filename and get directory
@@ -81,9 +127,8 @@ class FileManager:
         student_dir = self._get_student_certificate_dir(student_id)
         file_path = student_dir / filename
         
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Stream file to disk (size is checked while writing)
+        size_bytes = await write_upload_file(file, file_path)
         
         # Generate relative URL (accessible via static file mount)
         relative_path = file_path.relative_to(self.upload_dir)
@@ -94,7 +139,7 @@ class FileManager:
             "file_url": file_url,
             "filename": filename,
             "original_filename": file.filename,
-            "size_bytes": len(file_content)
+            "size_bytes": size_bytes
         }
     
     def verify_certificate_access(
@@ -118,14 +163,8 @@ class FileManager:
         if is_admin:
             return True
         
-        # Convert URL to path if needed
-        if file_path.startswith("/uploads/"):
-            file_path = file_path.replace("/uploads/", "")
-        
-        # Check if file belongs to student's directory
-        expected_prefix = f"certificates/student_{student_id}/"
-        
-        return file_path.startswith(expected_prefix)
+        # Convert URL to path if needed, then check the file is in the student's directory
+        return file_path.removeprefix("/uploads/").startswith(_student_certificate_prefix(student_id))
     
     def get_certificate_full_path(self, file_url: str) -> Optional[Path]:
         """
@@ -141,22 +180,35 @@ class FileManager:
             return None
         
         # Remove /uploads/ prefix
-        relative_path = file_url.replace("/uploads/", "")
+        relative_path = file_url.removeprefix("/uploads/")
         full_path = self.upload_dir / relative_path
         
-        # Verify file exists
-        if not full_path.exists() or not full_path.is_file():
+        # Security check: ensure path is within upload directory
+        if not os.path.realpath(full_path).startswith(self._upload_root):
+            # Path is outside upload directory - security violation
             return None
         
-        # Security check: ensure path is within upload directory
+        # Verify file exists (a single stat)
         try:
-            full_path.resolve().relative_to(self.upload_dir.resolve())
-        except ValueError:
-            # Path is outside upload directory - security violation
+            if not stat.S_ISREG(os.stat(full_path).st_mode):
+                return None
+        except OSError:
             return None
         
         return full_path
     
+    def build_accel_redirect(self, file_url: str) -> str:
+        """
+        Map a public file URL to the reverse proxy's internal location
+        
+        Args:
+            file_url: URL like /uploads/certificates/student_1/cert_xxx.jpg
+            
+        Returns:
+            Internal URI for the X-Accel-Redirect header
+        """
+        return settings.ACCEL_REDIRECT_PREFIX + file_url.removeprefix("/uploads/")
+    
     def delete_certificate(self, file_url: str, student_id: int, is_admin: bool = False) -> bool:
         """
         Delete a certificate file
@@ -192,22 +244,41 @@ class FileManager:
         Args:
             max_age_hours: Maximum age in hours before deletion
         """
-        now = datetime.now()
+        cutoff = time.time() - max_age_hours * 3600
         count = 0
         
-        for temp_file in self.temp_certificates_dir.iterdir():
-            if temp_file.is_file():
+        with os.scandir(self.temp_certificates_dir) as entries:
+            for entry in entries:
                 # Check file age
-                file_age = now - datetime.fromtimestamp(temp_file.stat().st_mtime)
-                if file_age.total_seconds() > (max_age_hours * 3600):
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
                     try:
-                        os.remove(temp_file)
+                        os.unlink(entry.path)
                         count += 1
-                    except Exception:
+                    except OSError:
                         pass
         
         return count
     
+    async def run_periodic_cleanup(self, interval_seconds: int = 3600, max_age_hours: int = 24):
+        """
+        Clean up temporary certificates forever, once every interval
+        
+        Meant to run as a background task; the directory scan runs in a worker
+        thread so it never blocks request handling.
+        
+        Args:
+            interval_seconds: Delay between cleanup runs
+            max_age_hours: Maximum age in hours before deletion
+        """
+        while True:
+            try:
+                count = await asyncio.to_thread(self.cleanup_temp_certificates, max_age_hours)
+                if count:
+                    print(f"Removed {count} expired temporary certificate(s)")
+            except OSError as e:
+                print(f"Temporary certificate cleanup failed: {e}")
+            await asyncio.sleep(interval_seconds)
+    
     def get_student_certificates(self, student_id: int) -> list:
         """
         Get list of all certificates for a student
@@ -219,16 +290,20 @@ class FileManager:
             List of certificate file info
         """
         student_dir = self._get_student_certificate_dir(student_id)
+        url_prefix = f"/uploads/{student_dir.relative_to(self.upload_dir).as_posix()}/"
         certificates = []
         
-        for cert_file in student_dir.iterdir():
-            if cert_file.is_file():
-                relative_path = cert_file.relative_to(self.upload_dir)
+        # scandir entries carry the file type, so only one stat per file is needed
+        with os.scandir(student_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
                 certificates.append({
-                    "filename": cert_file.name,
-                    "url": f"/uploads/{relative_path.as_posix()}",
-                    "size_bytes": cert_file.stat().st_size,
-                    "created_at": datetime.fromtimestamp(cert_file.stat().st_ctime).isoformat()
+                    "filename": entry.name,
+                    "url": url_prefix + entry.name,
+                    "size_bytes": st.st_size,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(st.st_ctime))
                 })
         
         return certificates
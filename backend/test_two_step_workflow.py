@@ -5,259 +5,449 @@ Tests the complete workflow: upload & recognize → confirm & submit
 
 import httpx
 import asyncio
+import aiofiles
+import aiofiles.os
+import json
+import logging
+import orjson
+import os
+import time
+import uuid
 from pathlib import Path
+from typing import Any, Optional
 
 
 BASE_URL = "http://localhost:8000"
 
+# Chunk size used when streaming files to the server
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
-async def test_two_step_workflow():
-    """Test the complete two-step achievement submission workflow"""
-    
-    print("=" * 70)
-    print("🧪 TESTING TWO-STEP ACHIEVEMENT SUBMISSION WORKFLOW")
-    print("=" * 70)
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        # Step 0: Login
-        print("\n📝 Step 0: Login as student...")
-        login_response = await client.post(
-            f"{BASE_URL}/api/auth/login",
-            data={
-                "username": "student1",
-                "password": "password123"
-            }
+# Progress output; set WORKFLOW_LOG=WARNING to show only problems
+logger = logging.getLogger("workflow")
+logger.setLevel(os.getenv("WORKFLOW_LOG", "INFO"))
+
+# Idempotent GET responses (health, teacher list) are reused across runs for this long
+HTTP_CACHE_PATH = Path(__file__).with_name(".http_cache.json")
+HTTP_CACHE_TTL_SECONDS = 60
+
+# Test images already checked (or created) during this process
+_prepared_test_images: set = set()
+
+# Shared keep-alive client, reused by every step of the test run
+CLIENT: Optional[httpx.AsyncClient] = None
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, creating it on first use"""
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=60.0,
+            # Multiplexes concurrent requests when the server is reached over
+            # HTTPS with HTTP/2; plain http:// URLs stay on HTTP/1.1
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30)
         )
+    return CLIENT
+
+
+async def close_client():
+    """Close the shared HTTP client so the next get_client() creates a fresh one"""
+    global CLIENT
+    if CLIENT is not None:
+        await CLIENT.aclose()
+        CLIENT = None
+
+
+def _ok(response: httpx.Response, failure: Optional[str] = None) -> Optional[Any]:
+    """
+    Unwrap a standard API envelope
+    
+    Args:
+        response: Response from the API
+        failure: Message to log when the request did not succeed
         
-        if login_response.status_code != 200:
-            print(f"❌ Login failed: {login_response.text}")
-            return
-        
-        login_data = login_response.json()
-        if login_data["code"] != 200:
-            print(f"❌ Login failed: {login_data}")
-            return
-            
-        token = login_data["data"]["token"]
-        print(f"✅ Login successful! Token: {token[:20]}...")
-        
-        headers = {"Authorization": f"Bearer {token}"}
-        
+    Returns:
+        The envelope's data, or None if the HTTP status or envelope code is not 200
+    """
+    if response.status_code != 200:
+        if failure:
+            logger.error("❌ %s: %s", failure, response.text)
+        return None
+    
+    body = orjson.loads(response.content)
+    if body.get("code") != 200:
+        if failure:
+            logger.error("❌ %s: %s", failure, body)
+        return None
+    
+    return body["data"]
+
+
+async def get_json_cached(
+    client: httpx.AsyncClient,
+    url: str,
+    ttl: float = HTTP_CACHE_TTL_SECONDS
+) -> Optional[dict]:
+    """
+    GET a JSON endpoint, reusing a recent response stored on disk
+    
+    Returns:
+        Parsed JSON body, or None if the request did not return 200
+    """
+    try:
+        async with aiofiles.open(HTTP_CACHE_PATH, "r") as f:
+            cache = json.loads(await f.read())
+    except (OSError, ValueError):
+        cache = {}
+    
+    entry = cache.get(url)
+    if entry and time.time() - entry[0] < ttl:
+        return entry[1]
+    
+    response = await client.get(url)
+    if response.status_code != 200:
+        logger.warning("⚠️  GET %s returned %s: %s", url, response.status_code, response.text)
+        return None
+    
+    data = response.json()
+    cache[url] = [time.time(), data]
+    async with aiofiles.open(HTTP_CACHE_PATH, "w") as f:
+        await f.write(json.dumps(cache))
+    return data
+
+
+async def _request_with_retry(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    *,
+    retries: int = 3,
+    delay: float = 0.3,
+    **kwargs
+) -> httpx.Response:
+    """
+    Send a request, retrying connection errors and 5xx responses
+    
+    Waits delay, 2*delay, 4*delay, ... between attempts. Retries go through
+    the same pooled client, so established connections are reused.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code < 500 or attempt == retries:
+                return response
+        await asyncio.sleep(delay * 2 ** attempt)
+
+
+class _MultipartFileBody:
+    """Multipart body that re-reads the file each time it is iterated (safe to retry)"""
+    
+    def __init__(self, head: bytes, file_path: str, tail: bytes):
+        self.head = head
+        self.file_path = file_path
+        self.tail = tail
+    
+    async def __aiter__(self):
+        yield self.head
+        async with aiofiles.open(self.file_path, "rb") as f:
+            while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+        yield self.tail
+
+
+async def ensure_test_image(image_path: str):
+    """Create a placeholder certificate if missing; checked once per process"""
+    if image_path in _prepared_test_images:
+        return
+    
+    if not await aiofiles.os.path.exists(image_path):
+        logger.warning("⚠️  Test image not found: %s", image_path)
+        logger.info("   Creating a placeholder. Replace with actual certificate image.")
+        async with aiofiles.open(image_path, "wb") as f:
+            await f.write(b"fake image content for testing")
+    
+    _prepared_test_images.add(image_path)
+
+
+async def post_file_streaming(
+    client: httpx.AsyncClient,
+    url: str,
+    file_path: str,
+    content_type: str,
+    field_name: str = "file"
+) -> httpx.Response:
+    """
+    Upload a file as multipart/form-data without loading it into memory
+    
+    The multipart body is produced chunk by chunk while the request is sent,
+    so the file is read from disk (without blocking the event loop) as the
+    upload progresses.
+    """
+    boundary = uuid.uuid4().hex
+    filename = os.path.basename(file_path)
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    
+    return await _request_with_retry(
+        client,
+        "POST",
+        url,
+        content=_MultipartFileBody(head, file_path, tail),
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + os.path.getsize(file_path) + len(tail))
+        }
+    )
+
+
+async def test_two_step_workflow(client: httpx.AsyncClient):
+    """Test the complete two-step achievement submission workflow"""
+    
+    logger.info("=" * 70)
+    logger.info("🧪 TESTING TWO-STEP ACHIEVEMENT SUBMISSION WORKFLOW")
+    logger.info("=" * 70)
+    
+    # Step 0: Login
+    logger.info("\n📝 Step 0: Login as student...")
+    login_response = await _request_with_retry(
+        client,
+        "POST",
+        "/api/auth/login",
+        data={
+            "username": "student1",
+            "password": "password123"
+        }
+    )
+    
+    login_data = _ok(login_response, "Login failed")
+    if login_data is None:
+        return
+    
+    token = login_data["token"]
+    logger.info("✅ Login successful! Token: %s...", token[:20])
+    
+    # Authenticate every following request made with this client
+    client.headers["Authorization"] = f"Bearer {token}"
+    
+    # The teacher list does not depend on the upload; fetch it in the background
+    teachers_task = asyncio.create_task(get_json_cached(client, "/api/common/teachers"))
+    
+    try:
         # Step 1: Upload certificate and get recognition
-        print("\n📤 Step 1: Upload certificate and recognize...")
+        logger.info("\n📤 Step 1: Upload certificate and recognize...")
         
         # Check if test image exists
         test_image_path = "test_certificate.jpg"
-        if not Path(test_image_path).exists():
-            print(f"⚠️  Test image not found: {test_image_path}")
-            print("   Creating a placeholder. Replace with actual certificate image.")
-            # Create a small test file
-            with open(test_image_path, "wb") as f:
-                f.write(b"fake image content for testing")
-        
-        with open(test_image_path, "rb") as f:
-            ocr_response = await client.post(
-                f"{BASE_URL}/api/v1/student/ocr/recognize",
-                headers=headers,
-                files={"file": (test_image_path, f, "image/jpeg")}
-            )
-        
-        if ocr_response.status_code != 200:
-            print(f"❌ OCR recognition failed: {ocr_response.text}")
-            return
-        
-        ocr_data = ocr_response.json()
-        if ocr_data["code"] != 200:
-            print(f"❌ OCR recognition failed: {ocr_data}")
-            return
-        
-        recognition_result = ocr_data["data"]
-        print("\n✅ Certificate recognized successfully!")
-        print(f"   File URL: {recognition_result.get('file_url')}")
-        print(f"   Recognized Title: {recognition_result['recognized_data'].get('title')}")
-        print(f"   Issuer: {recognition_result['recognized_data'].get('issuer')}")
-        print(f"   Date: {recognition_result['recognized_data'].get('date')}")
-        print(f"   Suggested Type: {recognition_result['recognized_data'].get('suggested_type')}")
-        print(f"   Award Level: {recognition_result['recognized_data'].get('award_level')}")
+        await ensure_test_image(test_image_path)
         
-        file_url = recognition_result["file_url"]
-        
-        # Step 1.5: Get list of certificates
-        print("\n📋 Step 1.5: Get my certificates list...")
-        certs_response = await client.get(
-            f"{BASE_URL}/api/v1/student/certificates",
-            headers=headers
-        )
-        
-        if certs_response.status_code == 200:
-            certs_data = certs_response.json()
-            if certs_data["code"] == 200:
-                print(f"✅ Found {certs_data['data']['total']} certificates")
-                for cert in certs_data['data']['certificates']:
-                    print(f"   - {cert['filename']} ({cert['size_bytes']} bytes)")
-        
-        # Step 2: User confirms and submits achievement
-        print("\n✔️  Step 2: Confirm and submit achievement...")
-        
-        # Get list of teachers first
-        teachers_response = await client.get(
-            f"{BASE_URL}/api/common/teachers",
-            headers=headers
-        )
-        
-        if teachers_response.status_code != 200:
-            print(f"❌ Failed to get teachers: {teachers_response.text}")
-            return
-        
-        teachers_data = teachers_response.json()
-        if not teachers_data["data"] or len(teachers_data["data"]) == 0:
-            print("❌ No teachers found in system. Please add teachers first.")
-            return
-        
-        teacher_id = teachers_data["data"][0]["id"]
-        print(f"   Using teacher: {teachers_data['data'][0]['name']} (ID: {teacher_id})")
-        
-        # Submit achievement with recognized data
-        achievement_data = {
-            "teacher_id": teacher_id,
-            "title": recognition_result['recognized_data'].get('title') or "Test Achievement",
-            "type": recognition_result['recognized_data'].get('suggested_type') or "competition",
-            "evidence_url": file_url,
-            "content_json": {
-                "issuer": recognition_result['recognized_data'].get('issuer'),
-                "date": recognition_result['recognized_data'].get('date'),
-                "award_level": recognition_result['recognized_data'].get('award_level'),
-                "certificate_number": recognition_result['recognized_data'].get('certificate_number'),
-                "ai_recognized": True
-            }
-        }
-        
-        submit_response = await client.post(
-            f"{BASE_URL}/api/v1/student/achievements",
-            headers=headers,
-            json=achievement_data
+        ocr_response = await post_file_streaming(
+            client,
+            "/api/v1/student/ocr/recognize",
+            test_image_path,
+            "image/jpeg"
         )
         
-        if submit_response.status_code != 200:
-            print(f"❌ Achievement submission failed: {submit_response.text}")
+        recognition_result = _ok(ocr_response, "OCR recognition failed")
+        if recognition_result is None:
             return
         
-        submit_data = submit_response.json()
-        if submit_data["code"] != 200:
-            print(f"❌ Achievement submission failed: {submit_data}")
-            return
-        
-        achievement_id = submit_data["data"]["id"]
-        print(f"✅ Achievement submitted successfully! ID: {achievement_id}")
-        
-        # Step 3: Verify achievement was created
-        print("\n🔍 Step 3: Verify achievement...")
-        achievements_response = await client.get(
-            f"{BASE_URL}/api/v1/student/achievements",
-            headers=headers
+        rd = recognition_result["recognized_data"]
+        logger.info("\n✅ Certificate recognized successfully!")
+        logger.info(
+            "   File URL: %s\n"
+            "   Recognized Title: %s\n"
+            "   Issuer: %s\n"
+            "   Date: %s\n"
+            "   Suggested Type: %s\n"
+            "   Award Level: %s",
+            recognition_result.get('file_url'),
+            rd.get('title'),
+            rd.get('issuer'),
+            rd.get('date'),
+            rd.get('suggested_type'),
+            rd.get('award_level')
         )
         
-        if achievements_response.status_code == 200:
-            achievements_data = achievements_response.json()
-            if achievements_data["code"] == 200:
-                achievements = achievements_data["data"]
-                matching = [a for a in achievements if a["id"] == achievement_id]
-                if matching:
-                    ach = matching[0]
-                    print("✅ Achievement verified in database:")
-                    print(f"   ID: {ach['id']}")
-                    print(f"   Title: {ach['title']}")
-                    print(f"   Type: {ach['type']}")
-                    print(f"   Status: {ach['status']}")
-                    print(f"   Evidence URL: {ach['evidence_url']}")
-                    print(f"   Teacher: {ach['teacher_name']}")
-        
-        # Step 4: Test access control
-        print("\n🔒 Step 4: Test certificate access control...")
+        file_url = recognition_result["file_url"]
         
-        # Try to access the certificate (should work)
-        cert_response = await client.get(
-            f"{BASE_URL}{file_url}",
-            headers=headers
+        # Step 1.5: Get list of certificates
+        logger.info("\n📋 Step 1.5: Get my certificates list...")
+        teachers_data, certs_response = await asyncio.gather(
+            teachers_task,
+            client.get("/api/v1/student/certificates")
         )
-        
-        if cert_response.status_code == 200:
-            print(f"✅ Certificate accessible to owner (status: {cert_response.status_code})")
-        else:
-            print(f"⚠️  Certificate access returned status: {cert_response.status_code}")
-        
-        # Try to access without token (should fail)
-        cert_response_no_auth = await client.get(f"{BASE_URL}{file_url}")
-        
-        if cert_response_no_auth.status_code == 401:
-            print(f"✅ Certificate blocked without authentication (status: {cert_response_no_auth.status_code})")
-        else:
-            print(f"⚠️  Certificate access without auth: {cert_response_no_auth.status_code}")
-        
-        print("\n" + "=" * 70)
-        print("✅ TWO-STEP WORKFLOW TEST COMPLETED!")
-        print("=" * 70)
-        print("\n📊 Summary:")
-        print("   1. ✅ Certificate uploaded and saved permanently")
-        print("   2. ✅ AI recognition extracted certificate data")
-        print("   3. ✅ Achievement created with recognized data")
-        print("   4. ✅ Access control verified")
-        print("\n🎉 All tests passed!")
-
-
-async def test_health_checks():
+    finally:
+        # No-op once the task has finished; stops it if we leave early
+        teachers_task.cancel()
+    
+    certs_data = _ok(certs_response)
+    if certs_data is not None:
+        logger.info("✅ Found %s certificates", certs_data['total'])
+        for cert in certs_data['certificates']:
+            logger.info("   - %s (%s bytes)", cert['filename'], cert['size_bytes'])
+    
+    # Step 2: User confirms and submits achievement
+    logger.info("\n✔️  Step 2: Confirm and submit achievement...")
+    
+    # Teacher list was fetched alongside the certificates list
+    if teachers_data is None:
+        logger.error("❌ Failed to get teachers")
+        return
+    
+    if not teachers_data["data"] or len(teachers_data["data"]) == 0:
+        logger.error("❌ No teachers found in system. Please add teachers first.")
+        return
+    
+    teacher_id = teachers_data["data"][0]["id"]
+    logger.info("   Using teacher: %s (ID: %s)", teachers_data['data'][0]['name'], teacher_id)
+    
+    # Submit achievement with recognized data (only fields the AI actually found)
+    content_json = {
+        key: rd[key]
+        for key in ("issuer", "date", "award_level", "certificate_number")
+        if rd.get(key) is not None
+    }
+    content_json["ai_recognized"] = True
+    
+    achievement_data = {
+        "teacher_id": teacher_id,
+        "title": rd.get('title') or "Test Achievement",
+        "type": rd.get('suggested_type') or "competition",
+        "evidence_url": file_url,
+        "content_json": content_json
+    }
+    
+    submit_response = await _request_with_retry(
+        client,
+        "POST",
+        "/api/v1/student/achievements",
+        json=achievement_data
+    )
+    
+    submit_data = _ok(submit_response, "Achievement submission failed")
+    if submit_data is None:
+        return
+    
+    achievement_id = submit_data["id"]
+    logger.info("✅ Achievement submitted successfully! ID: %s", achievement_id)
+    
+    # Step 3: Verify achievement was created
+    logger.info("\n🔍 Step 3: Verify achievement...")
+    achievements_response = await _request_with_retry(client, "GET", "/api/v1/student/achievements")
+    
+    achievements = _ok(achievements_response)
+    if achievements is not None:
+        matching = [a for a in achievements if a["id"] == achievement_id]
+        if matching:
+            ach = matching[0]
+            logger.info("✅ Achievement verified in database:")
+            logger.info("   ID: %s", ach['id'])
+            logger.info("   Title: %s", ach['title'])
+            logger.info("   Type: %s", ach['type'])
+            logger.info("   Status: %s", ach['status'])
+            logger.info("   Evidence URL: %s", ach['evidence_url'])
+            logger.info("   Teacher: %s", ach['teacher_name'])
+    
+    # Step 4: Test access control
+    logger.info("\n🔒 Step 4: Test certificate access control...")
+    
+    # Try to access the certificate (should work)
+    cert_response = await client.get(file_url)
+    
+    if cert_response.status_code == 200:
+        logger.info("✅ Certificate accessible to owner (status: %s)", cert_response.status_code)
+    else:
+        logger.warning("⚠️  Certificate access returned status: %s", cert_response.status_code)
+    
+    # Try to access without token (should fail)
+    cert_response_no_auth = await client.get(file_url, headers={"Authorization": ""})
+    
+    if cert_response_no_auth.status_code == 401:
+        logger.info("✅ Certificate blocked without authentication (status: %s)", cert_response_no_auth.status_code)
+    else:
+        logger.warning("⚠️  Certificate access without auth: %s", cert_response_no_auth.status_code)
+    
+    logger.info("\n" + "=" * 70)
+    logger.info("✅ TWO-STEP WORKFLOW TEST COMPLETED!")
+    logger.info("=" * 70)
+    logger.info("\n📊 Summary:")
+    logger.info("   1. ✅ Certificate uploaded and saved permanently")
+    logger.info("   2. ✅ AI recognition extracted certificate data")
+    logger.info("   3. ✅ Achievement created with recognized data")
+    logger.info("   4. ✅ Access control verified")
+    logger.info("\n🎉 All tests passed!")
+
+
+async def test_health_checks(client: httpx.AsyncClient):
     """Test health check endpoints"""
-    print("\n🏥 Health Checks:")
-    print("-" * 60)
+    logger.info("\n🏥 Health Checks:")
+    logger.info("-" * 60)
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # Test main API
-        try:
-            response = await client.get(f"{BASE_URL}/health")
-            print(f"✅ Main API: {response.json()}")
-        except Exception as e:
-            print(f"❌ Main API: {e}")
-        
-        # Test certificate recognition service
-        try:
-            response = await client.get(f"{BASE_URL}/api/certificate/health")
-            result = response.json()
-            if result.get("configured"):
-                print(f"✅ Certificate Recognition: {result['message']}")
-            else:
-                print(f"⚠️  Certificate Recognition: {result['message']}")
-        except Exception as e:
-            print(f"❌ Certificate Recognition: {e}")
+    # Test main API
+    try:
+        result = await get_json_cached(client, "/health")
+        if result is None:
+            logger.error("❌ Main API: health check failed")
+        else:
+            logger.info("✅ Main API: %s", result)
+    except Exception as e:
+        logger.error("❌ Main API: %s", e)
+    
+    # Test certificate recognition service
+    try:
+        result = await get_json_cached(client, "/api/certificate/health")
+        if result is None:
+            logger.error("❌ Certificate Recognition: health check failed")
+        elif result.get("configured"):
+            logger.info("✅ Certificate Recognition: %s", result['message'])
+        else:
+            logger.warning("⚠️  Certificate Recognition: %s", result['message'])
+    except Exception as e:
+        logger.error("❌ Certificate Recognition: %s", e)
 
 
 async def main():
     """Main test runner"""
-    print("""
+    logger.info("""
 ╔══════════════════════════════════════════════════════════════════╗
 ║     Two-Step Achievement Submission - Integration Test          ║
 ╚══════════════════════════════════════════════════════════════════╝
     """)
     
-    # Check if server is running
+    client = await get_client()
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            await client.get(f"{BASE_URL}/health")
-    except Exception:
-        print("❌ ERROR: Server is not running!")
-        print(f"   Please start the server first: python main.py")
-        print(f"   Expected URL: {BASE_URL}")
-        return
-    
-    await test_health_checks()
-    print()
-    await test_two_step_workflow()
+        # Check if server is running
+        try:
+            await client.get("/health", timeout=5.0)
+        except Exception:
+            logger.error("❌ ERROR: Server is not running!")
+            logger.error("   Please start the server first: python main.py")
+            logger.error("   Expected URL: %s", BASE_URL)
+            return
+        
+        await test_health_checks(client)
+        logger.info("")
+        await test_two_step_workflow(client)
+    finally:
+        await close_client()
     
-    print("\n💡 Tips:")
-    print("   - Replace 'test_certificate.jpg' with a real certificate image")
-    print("   - Ensure QWEN_API_KEY is configured in .env")
-    print("   - Default login: username='student1', password='password123'")
-    print("   - Check server logs for detailed information")
+    logger.info("\n💡 Tips:")
+    logger.info("   - Replace 'test_certificate.jpg' with a real certificate image")
+    logger.info("   - Ensure QWEN_API_KEY is configured in .env")
+    logger.info("   - Default login: username='student1', password='password123'")
+    logger.info("   - Check server logs for detailed information")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
     asyncio.run(main())
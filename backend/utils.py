@@ -1,12 +1,53 @@
+import os
+import time
+import uuid
 from typing import Optional, Any
-from schemas import ResponseModel
+import orjson
+
+
+# Envelopes for the default arguments; callers get a copy since responses may be mutated
+_OK_EMPTY = {"code": 200, "msg": "success", "data": None}
+_ERR_EMPTY = {"code": 400, "msg": "error", "data": None}
 
 
 def success_response(data: Any = None, msg: str = "success", code: int = 200) -> dict:
-    """Create a successful response"""
-    return ResponseModel(code=code, msg=msg, data=data).model_dump()
+    """Create a successful response (same shape as schemas.ResponseModel)"""
+    if data is None and msg == "success" and code == 200:
+        return _OK_EMPTY.copy()
+    return {"code": code, "msg": msg, "data": data}
 
 
 def error_response(msg: str = "error", code: int = 400, data: Any = None) -> dict:
-    """Create an error response"""
-    return ResponseModel(code=code, msg=msg, data=data).model_dump()
+    """Create an error response (same shape as schemas.ResponseModel)"""
+    if data is None and msg == "error" and code == 400:
+        return _ERR_EMPTY.copy()
+    return {"code": code, "msg": msg, "data": data}
+
+
+def success_response_bytes(data: Any = None, msg: str = "success", code: int = 200) -> bytes:
+    """
+    Create a successful response already encoded as JSON
+    
+    Return it as Response(content=..., media_type="application/json") from
+    endpoints whose data is plain JSON types (dicts, lists, str, numbers),
+    so FastAPI skips jsonable_encoder and re-encoding the envelope.
+    """
+    return orjson.dumps({"code": code, "msg": msg, "data": data})
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562)
+    
+    The leading 48 bits are a millisecond timestamp, so new values sort after
+    older ones and primary key inserts land at the end of the index.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= (rand >> 68) << 64  # rand_a (12 bits)
+    value |= 0b10 << 62  # variant
+    value |= rand & ((1 << 62) - 1)  # rand_b (62 bits)
+    return uuid.UUID(int=value)